@@ -0,0 +1,166 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, 'src'))
+
+import scanner
+import sanitizer
+import generator
+from create_test_monolith import create_synthetic_project
+
+# Замеры сканера, санитайзера и полной генерации на синтетических монолитах
+# разного размера. Каждый запуск дописывается строкой в RESULTS_FILE, так что
+# результаты можно сравнивать между коммитами (--compare).
+
+RESULTS_FILE = os.path.join(current_dir, "benchmark_results.jsonl")
+
+SIZES = {
+    "small": {"modules": 10, "files_per_module": 5, "models_per_module": 3, "shared_libs": 1, "shared_lib_files": 5},
+    "medium": {"modules": 50, "files_per_module": 10, "models_per_module": 5, "shared_libs": 3, "shared_lib_files": 10},
+    "large": {"modules": 200, "files_per_module": 20, "models_per_module": 8, "shared_libs": 5, "shared_lib_files": 20},
+}
+
+def measure(func, repeat=1, setup=None):
+    """
+    Время — лучший из repeat запусков без tracemalloc (он замедляет код),
+    пиковая память — отдельным запуском под tracemalloc.
+    setup вызывается перед каждым запуском и в замер не входит.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        with redirect_stdout(io.StringIO()):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(min(times), 6), "peak_kb": round(peak / 1024, 1)}
+
+def sanitize_all(source_path):
+    """Очистка всех .py модулей без кэша — чистая стоимость санитайзера."""
+    for dirpath, _, filenames in os.walk(source_path):
+        for name in filenames:
+            if name.endswith('.py'):
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    sanitizer.sanitize_bytes(f.read())
+
+def run_cases(source_path, work_dir, repeat, workers):
+    output_path = os.path.join(work_dir, "docker_out")
+
+    def reset_output():
+        # clean_output сохраняет .amm_cache — без удаления прогон был бы тёплым
+        shutil.rmtree(output_path, ignore_errors=True)
+
+    def generate_cold():
+        generator.run_generation(source_path, output_path, workers=workers)
+
+    def generate_incremental():
+        generator.run_generation(source_path, output_path, incremental=True, workers=workers)
+
+    return {
+        "scanner": measure(lambda: scanner.scan_project_structure(source_path), repeat),
+        "sanitizer": measure(lambda: sanitize_all(source_path), repeat),
+        "run_generation": measure(generate_cold, repeat, setup=reset_output),
+        # после холодного прогона ничего не изменилось — все сервисы пропускаются
+        "run_generation_incremental": measure(generate_incremental, repeat),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=current_dir,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def print_comparison(record, previous):
+    if not previous:
+        print("   (нет предыдущих замеров для сравнения)")
+        return
+    print(f"   сравнение с {previous['timestamp']} ({previous.get('commit') or '?'}):")
+    for case, values in record["cases"].items():
+        old = previous["cases"].get(case)
+        if not old:
+            continue
+        delta = (values["seconds"] - old["seconds"]) / old["seconds"] * 100 if old["seconds"] else 0.0
+        print(f"      {case}: {old['seconds']:.3f} → {values['seconds']:.3f} с ({delta:+.1f}%), "
+              f"память {old['peak_kb']:.0f} → {values['peak_kb']:.0f} КБ")
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сканера, санитайзера и генерации на синтетических монолитах")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=sorted(SIZES))
+    parser.add_argument("--repeat", type=int, default=3, help="Число запусков для замера времени (берётся лучший)")
+    parser.add_argument("--workers", type=int, default=1, help="Потоки сборки для run_generation")
+    parser.add_argument("--import-density", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--compare", action="store_true", help="Сравнить с последним замером того же размера")
+    parser.add_argument("--no-save", action="store_true", help="Не записывать результат")
+    args = parser.parse_args()
+
+    history = load_results(args.results)
+    for size in args.sizes:
+        params = dict(SIZES[size], import_density=args.import_density, seed=args.seed)
+        work_dir = tempfile.mkdtemp(prefix=f"amm_bench_{size}_")
+        try:
+            source_path = os.path.join(work_dir, "monolith")
+            with redirect_stdout(io.StringIO()):
+                create_synthetic_project(source_path, **params)
+            print(f"📏 {size}: модулей {params['modules']}, файлов в модуле {params['files_per_module']}")
+            cases = run_cases(source_path, work_dir, args.repeat, args.workers)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        for case, values in cases.items():
+            print(f"   {case}: {values['seconds']:.3f} с, пик памяти {values['peak_kb']:.0f} КБ")
+
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "size": size,
+            "params": params,
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "cases": cases,
+        }
+        if args.compare:
+            same = [r for r in history if r.get("size") == size and r.get("params") == params and r.get("workers") == args.workers]
+            print_comparison(record, same[-1] if same else None)
+        if not args.no_save:
+            with open(args.results, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
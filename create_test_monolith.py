@@ -1,4 +1,18 @@
 import os
+import random
+import argparse
+
+# Функция, которая физически создает папки и файлы
+def write_structure(base, struct):
+    for name, content in struct.items():
+        path = os.path.join(base, name)
+        
+        if name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+            write_structure(path, content) # Рекурсия для вложенных папок
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
 
 def create_dummy_project():
     # Название папки, которая появится
@@ -66,18 +80,6 @@ def list():
         }
     }
 
-    # Функция, которая физически создает папки и файлы
-    def write_structure(base, struct):
-        for name, content in struct.items():
-            path = os.path.join(base, name)
-            
-            if name.endswith("/"):
-                os.makedirs(path, exist_ok=True)
-                write_structure(path, content) # Рекурсия для вложенных папок
-            else:
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(content)
-
     # Проверка, чтобы не перезаписать случайно
     if os.path.exists(base_dir):
         print(f"⚠️ Папка '{base_dir}' уже существует.")
@@ -88,5 +90,121 @@ def list():
         print(f"✅ Успех! Папка '{base_dir}' создана.")
         print("Внутри лежат файлы: app.py, requirements.txt и папки модулей.")
 
+# Пакеты, из которых набираются requirements.txt модулей синтетического монолита
+SYNTHETIC_PACKAGES = [
+    "reportlab==4.0.0", "pillow==10.2.0", "redis==5.0.1", "celery==5.3.6",
+    "pydantic==2.6.1", "marshmallow==3.20.2", "python-dateutil==2.8.2", "pyjwt==2.8.0",
+    "boto3==1.34.34", "stripe==8.1.0", "jinja2==3.1.3", "pyyaml==6.0.1",
+]
+
+def synthetic_structure(modules=10, files_per_module=5, models_per_module=3, shared_libs=1,
+                        shared_lib_files=5, import_density=0.2, requirements_per_module=1, seed=0):
+    """
+    Структура синтетического монолита для замеров на масштабе.
+    modules — число модулей-сервисов (в каждом views.py и models.py);
+    files_per_module — сколько ещё вспомогательных .py-файлов в модуле;
+    models_per_module — моделей в models.py (с ForeignKey и relationship
+    на модели других модулей, чтобы санитайзеру было что чистить);
+    shared_libs / shared_lib_files — общие библиотеки без views и их размер;
+    import_density — доля других модулей, которые импортирует каждый модуль;
+    requirements_per_module — число собственных зависимостей модуля.
+    seed делает результат воспроизводимым.
+    """
+    rng = random.Random(seed)
+    module_names = [f"module_{i:03d}" for i in range(modules)]
+    shared_names = [f"shared_{i:02d}" for i in range(shared_libs)]
+
+    def model_name(module, index):
+        return f"{module.title().replace('_', '')}Item{index}"
+
+    structure = {
+        "app.py": "from flask import Flask\n"
+                  + "".join(f"from {m}.views import bp as {m}_bp\n" for m in module_names)
+                  + "\napp = Flask(__name__)\n"
+                  + "".join(f"app.register_blueprint({m}_bp, url_prefix='/{m}')\n" for m in module_names),
+        "db.py": "from flask_sqlalchemy import SQLAlchemy\ndb = SQLAlchemy()\n",
+        "requirements.txt": "Flask==3.0.0\nrequests==2.31.0\npsycopg2-binary==2.9.9\n",
+    }
+
+    for shared in shared_names:
+        files = {"__init__.py": ""}
+        for i in range(shared_lib_files):
+            files[f"helpers_{i}.py"] = (
+                "import json\n\n"
+                + "".join(f"def helper_{i}_{j}(value):\n    return json.dumps({{'value': value, 'n': {j}}})\n\n" for j in range(10))
+            )
+        structure[f"{shared}/"] = files
+
+    for module in module_names:
+        others = [m for m in module_names if m != module]
+        imported = rng.sample(others, min(len(others), round(len(others) * import_density)))
+        used_shared = rng.sample(shared_names, rng.randint(0, len(shared_names))) if shared_names else []
+
+        views = "from flask import Blueprint\n"
+        views += "".join(f"from {m}.models import {model_name(m, 0)}\n" for m in imported)
+        views += "".join(f"from {s} import helpers_0\n" for s in used_shared if shared_lib_files)
+        views += f"\nbp = Blueprint('{module}', __name__)\n\n"
+        views += f"@bp.route('/')\ndef index():\n    return '{module}'\n"
+
+        models = "from db import db\n\n"
+        for i in range(models_per_module):
+            models += f"class {model_name(module, i)}(db.Model):\n"
+            models += f"    __tablename__ = '{module}_item{i}'\n"
+            models += "    id = db.Column(db.Integer, primary_key=True)\n"
+            models += "    name = db.Column(db.String(120), nullable=False)\n"
+            if imported:
+                target = rng.choice(imported)
+                models += f"    ref_id = db.Column(db.Integer, db.ForeignKey('{target}_item0.id'), nullable=True)\n"
+                models += f"    ref = db.relationship('{model_name(target, 0)}', backref=db.backref('{module}_items_{i}', lazy=True))\n"
+            models += "\n"
+
+        files = {"__init__.py": "", "views.py": views, "models.py": models}
+        for i in range(files_per_module):
+            files[f"utils_{i}.py"] = (
+                "import math\n\n"
+                + "".join(f"def compute_{i}_{j}(x):\n    return math.sqrt(abs(x)) * {j}\n\n" for j in range(20))
+            )
+        if requirements_per_module:
+            packages = rng.sample(SYNTHETIC_PACKAGES, min(len(SYNTHETIC_PACKAGES), requirements_per_module))
+            files["requirements.txt"] = "\n".join(packages) + "\n"
+        structure[f"{module}/"] = files
+
+    return structure
+
+def create_synthetic_project(base_dir, **params):
+    """Синтетический монолит в base_dir (параметры — см. synthetic_structure)."""
+    if os.path.exists(base_dir):
+        print(f"⚠️ Папка '{base_dir}' уже существует.")
+        return False
+    os.makedirs(base_dir)
+    write_structure(base_dir, synthetic_structure(**params))
+    print(f"✅ Синтетический монолит создан: {base_dir} (модулей: {params.get('modules', 10)})")
+    return True
+
 if __name__ == "__main__":
-    create_dummy_project()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Тестовый монолит: игрушечный магазин или синтетический проект заданного размера")
+    parser.add_argument("--modules", type=int, help="Число модулей (без параметра — игрушечный магазин)")
+    parser.add_argument("--output", default="test_monolith_synthetic")
+    parser.add_argument("--files-per-module", type=int, default=5)
+    parser.add_argument("--models-per-module", type=int, default=3)
+    parser.add_argument("--shared-libs", type=int, default=1)
+    parser.add_argument("--shared-lib-files", type=int, default=5)
+    parser.add_argument("--import-density", type=float, default=0.2)
+    parser.add_argument("--requirements-per-module", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.modules is None:
+        create_dummy_project()
+    else:
+        create_synthetic_project(
+            args.output,
+            modules=args.modules,
+            files_per_module=args.files_per_module,
+            models_per_module=args.models_per_module,
+            shared_libs=args.shared_libs,
+            shared_lib_files=args.shared_lib_files,
+            import_density=args.import_density,
+            requirements_per_module=args.requirements_per_module,
+            seed=args.seed,
+        )
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import traceback
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(current_dir, 'src'))
+
+# Консольный запуск без GUI: для CI и сборочных хостов без дисплея.
+# Несколько монолитов обрабатываются параллельно в отдельных процессах,
+# логи генератора идут в stderr, итог — JSON в stdout.
+
+EXIT_OK = 0
+EXIT_SERVICES_FAILED = 1  # генерация прошла, но часть сервисов с ошибками
+EXIT_SOURCE_FAILED = 3    # монолит не обработан (нет пути, исключение)
+
+def generate_one(source_path, output_path, options):
+    """
+    Задача для пула процессов: stdout генератора перехватывается, чтобы
+    логи разных монолитов не перемешивались. Исключения не выходят наружу.
+    """
+    started = time.perf_counter()
+    log = io.StringIO()
+    outcome = {"source": source_path, "output": output_path}
+    try:
+        with redirect_stdout(log):
+            import generator
+            result = generator.run_generation(source_path, output_path, **options)
+        if result is None:
+            outcome.update(status="error", error="Путь к монолиту не найден")
+        else:
+            outcome.update(status="failed" if result["failed"] else "ok", **result)
+    except Exception as e:
+        outcome.update(status="error", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    outcome["seconds"] = round(time.perf_counter() - started, 3)
+    outcome["log"] = log.getvalue()
+    return outcome
+
+def exit_code(outcome):
+    return {"ok": EXIT_OK, "failed": EXIT_SERVICES_FAILED}.get(outcome["status"], EXIT_SOURCE_FAILED)
+
+def resolve_output(source_path, args):
+    if args.output:
+        return args.output
+    if args.output_root:
+        # у каждого монолита свой подкаталог, чтобы результаты не пересекались
+        name = os.path.basename(os.path.normpath(os.path.abspath(source_path)))
+        return os.path.join(args.output_root, name, "docker_out")
+    return os.path.join(source_path, "docker_out")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="AMM-Docker: генерация Docker-инфраструктуры для монолитов без GUI",
+        epilog=f"Коды выхода: {EXIT_OK} — успех, {EXIT_SERVICES_FAILED} — часть сервисов с ошибками, "
+               f"2 — неверные аргументы, {EXIT_SOURCE_FAILED} — монолит не обработан.",
+    )
+    parser.add_argument("sources", nargs="+", help="Каталоги монолитов")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("-o", "--output", help="Каталог результата (только для одного монолита)")
+    output.add_argument("--output-root", help="Общий каталог: результат в <root>/<имя монолита>/docker_out")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="Монолитов параллельно (0 — по числу ядер)")
+    parser.add_argument("--workers", type=int, default=1, help="Потоков сборки сервисов внутри монолита (0 — по числу ядер)")
+    parser.add_argument("--incremental", action="store_true", help="Пересобирать только изменившиеся сервисы")
+    parser.add_argument("--no-analyze-imports", action="store_true", help="Не строить граф импортов (все заглушки и библиотеки)")
+    parser.add_argument("--shared-mode", default="copy", choices=["copy", "hardlink", "context"])
+    parser.add_argument("--wheelhouse", action="store_true")
+    parser.add_argument("--server", default="gunicorn", choices=["gunicorn", "dev"])
+    parser.add_argument("--pgbouncer", action="store_true")
+    parser.add_argument("--db-max-connections", type=int, default=100)
+    parser.add_argument("--metrics", action="store_true")
+    parser.add_argument("--output-format", default="dir", choices=["dir", "tar"],
+                        help="Контексты сервисов каталогами или детерминированными tar-архивами")
+    parser.add_argument("--outbox", action="store_true", help="Асинхронные записи между сервисами через outbox")
+    parser.add_argument("--prune-requirements", action="store_true", help="Оставить в сервисе только импортируемые зависимости")
+    parser.add_argument("--profile", action="store_true", help="Запуск под cProfile (generation.prof)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Не выводить логи генератора в stderr")
+    parser.add_argument("--include-log", action="store_true", help="Добавить лог генерации в JSON")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.output and len(args.sources) > 1:
+        parser.error("--output допустим только для одного монолита, используйте --output-root")
+
+    options = {
+        "incremental": args.incremental,
+        "workers": args.workers,
+        "analyze_imports": not args.no_analyze_imports,
+        "shared_mode": args.shared_mode,
+        "wheelhouse": args.wheelhouse,
+        "server": args.server,
+        "pgbouncer": args.pgbouncer,
+        "db_max_connections": args.db_max_connections,
+        "metrics": args.metrics,
+        "profile": args.profile,
+        "prune_requirements": args.prune_requirements,
+        "output_format": args.output_format,
+        "outbox": args.outbox,
+    }
+    tasks = [(source, resolve_output(source, args)) for source in args.sources]
+    jobs = min(args.jobs if args.jobs > 0 else (os.cpu_count() or 1), len(tasks))
+
+    def report(outcome):
+        if not args.quiet:
+            sys.stderr.write(f"--- {outcome['source']} → {outcome['output']} ({outcome['status']}) ---\n{outcome['log']}\n")
+            sys.stderr.flush()
+        if not args.include_log:
+            outcome.pop("log")
+        return outcome
+
+    if jobs == 1:
+        outcomes = [report(generate_one(source, output, options)) for source, output in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(generate_one, source, output, options) for source, output in tasks]
+            outcomes = [report(future.result()) for future in futures]
+
+    code = max(exit_code(outcome) for outcome in outcomes)
+    json.dump({"exit_code": code, "results": outcomes}, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,8 @@ from tkinter import filedialog, messagebox
 import threading
 import sys
 import os
+import re
+import queue
 import subprocess
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -10,6 +12,29 @@ sys.path.append(os.path.join(current_dir, 'src'))
 
 import generator
 
+# Лог терминала: потоки только кладут текст в очередь, главный цикл Tk
+# забирает его пачками по таймеру
+LOG_POLL_MS = 50          # период опроса очереди
+LOG_BATCH_LIMIT = 2000    # фрагментов за один проход (остальное — в следующем)
+LOG_MAX_LINES = 5000      # хранимая история терминала
+
+# Эвристика раскраски: первый подошедший тег (порядок важен)
+LOG_TAG_PATTERNS = [
+    (tag, re.compile("|".join(re.escape(word) for word in words)))
+    for tag, words in [
+        ("error", ["❌", "Ошибка", "ERROR", "failed", "Traceback", "Exception"]),
+        ("success", ["✅", "Успешно", "Success", "Healthy"]),
+        ("info", ["🐳", "▶️", "🛑", "---", "Building", "Status", "Container"]),
+        ("warning", ["WARN", "Warning", "⚠️"]),
+    ]
+]
+
+def log_tag(line):
+    for tag, pattern in LOG_TAG_PATTERNS:
+        if pattern.search(line):
+            return tag
+    return "default"
+
 class AMMApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -104,7 +129,10 @@ class AMMApp(ctk.CTk):
         self.log_view.tag_config("default", foreground="#F8F8F2")    # Стандартный бело-серый
 
         self.final_output_path = ""
+        self.log_queue = queue.SimpleQueue()
+        self.log_pending = ""
         sys.stdout = self
+        self.after(LOG_POLL_MS, self.pump_log)
 
     def toggle_output_input(self):
         if self.use_default_output.get():
@@ -125,23 +153,41 @@ class AMMApp(ctk.CTk):
             self.out_path_entry.insert(0, d)
 
     def write(self, txt):
-        """Перехват принтов и умная раскраска логов терминала"""
-        self.log_view.configure(state="normal")
-        
-        # Эвристика раскраски текста
-        if any(w in txt for w in ["❌", "Ошибка", "ERROR", "failed", "Traceback", "Exception"]):
-            self.log_view.insert("end", txt, "error")
-        elif any(w in txt for w in ["✅", "Успешно", "Success", "Healthy"]):
-            self.log_view.insert("end", txt, "success")
-        elif any(w in txt for w in ["🐳", "▶️", "🛑", "---", "Building", "Status", "Container"]):
-            self.log_view.insert("end", txt, "info")
-        elif any(w in txt for w in ["WARN", "Warning", "⚠️"]):
-            self.log_view.insert("end", txt, "warning")
-        else:
-            self.log_view.insert("end", txt, "default")
-            
-        self.log_view.see("end")
-        self.log_view.configure(state="disabled")
+        """Перехват принтов: из любого потока, Tk здесь не трогается"""
+        self.log_queue.put(txt)
+
+    def pump_log(self):
+        """Забирает накопленный лог пачкой и выводит одной вставкой на тег"""
+        fragments = []
+        try:
+            while len(fragments) < LOG_BATCH_LIMIT:
+                fragments.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if fragments:
+            lines = (self.log_pending + "".join(fragments)).splitlines(keepends=True)
+            # незавершённая строка ждёт продолжения, если оно уже в очереди
+            self.log_pending = lines.pop() if lines and not lines[-1].endswith("\n") and not self.log_queue.empty() else ""
+
+            chunks = []
+            for line in lines:
+                tag = log_tag(line)
+                if chunks and chunks[-1][1] == tag:
+                    chunks[-1][0].append(line)
+                else:
+                    chunks.append(([line], tag))
+
+            self.log_view.configure(state="normal")
+            for chunk_lines, tag in chunks:
+                self.log_view.insert("end", "".join(chunk_lines), tag)
+            excess = int(self.log_view.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+            if excess > 0:
+                self.log_view.delete("1.0", f"{excess + 1}.0")
+            self.log_view.see("end")
+            self.log_view.configure(state="disabled")
+
+        self.after(1 if not self.log_queue.empty() else LOG_POLL_MS, self.pump_log)
 
     def flush(self): pass
 
@@ -162,6 +208,13 @@ class AMMApp(ctk.CTk):
 
         self.run_btn.configure(state="disabled", text="Анализ...")
         self.docker_frame.pack_forget()
+        # вывод прошлого запуска, ещё не попавший в окно, после очистки не нужен
+        try:
+            while True:
+                self.log_queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.log_pending = ""
         self.log_view.configure(state="normal")
         self.log_view.delete("1.0", "end")
         self.log_view.configure(state="disabled")
@@ -1 +1,167 @@
-# Логика принятия решений
\ No newline at end of file
+# Логика принятия решений
+import os
+import ast
+import fingerprint
+
+CACHE_VERSION = 1
+SKIP_DIRS = {'__pycache__', 'venv', 'env', 'node_modules', 'instance'}
+# Файлы из корня монолита, которые копируются в каждый сервис: их импорты
+# нужны всем сервисам. В графе они — узел ROOT_NODE.
+ROOT_FILES = ('db.py',)
+ROOT_NODE = '<root>'
+
+
+def _relative_base(rel_file, level):
+    """Пакет, от которого отсчитывается относительный импорт уровня level."""
+    package = rel_file.split('/')[:-1]
+    if level - 1 > len(package):
+        return []
+    return package[:len(package) - (level - 1)]
+
+
+def parse_imports(file_path, rel_file):
+    """
+    Возвращает отсортированный список top-level имён, импортируемых файлом.
+    rel_file — путь файла относительно корня монолита (через '/'),
+    нужен для разрешения относительных импортов.
+    Бросает SyntaxError, если файл не парсится.
+    """
+    with open(file_path, 'rb') as f:
+        tree = ast.parse(f.read(), filename=file_path)
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.add(alias.name.split('.')[0])
+        elif isinstance(node, ast.ImportFrom):
+            if node.level == 0:
+                if node.module:
+                    names.add(node.module.split('.')[0])
+                continue
+            base = _relative_base(rel_file, node.level)
+            if base:
+                names.add(base[0])
+            elif node.module:
+                names.add(node.module.split('.')[0])
+            else:
+                names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.Call) and node.args:
+            # importlib.import_module("x.y") / __import__("x") с константой
+            func = node.func
+            func_name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+            arg = node.args[0]
+            if func_name in ('import_module', '__import__') and isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                if not arg.value.startswith('.'):
+                    names.add(arg.value.split('.')[0])
+    return sorted(names)
+
+
+def iter_module_files(source_path, module_path):
+    module_dir = os.path.join(source_path, module_path)
+    for root, dirs, files in os.walk(module_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS)
+        for name in sorted(files):
+            if name.endswith('.py'):
+                full_path = os.path.join(root, name)
+                yield full_path, os.path.relpath(full_path, source_path).replace(os.sep, '/')
+
+
+def iter_root_files(source_path):
+    for name in ROOT_FILES:
+        full_path = os.path.join(source_path, name)
+        if os.path.isfile(full_path):
+            yield full_path, name
+
+
+def analyze_project(source_path, modules, cache_path=None, stat_cache=None):
+    """
+    Строит граф импортов между модулями монолита.
+    Результат: {имя_модуля: {"imports": [внутренние модули],
+                             "external": [внешние пакеты],
+                             "complete": bool}}
+    complete=False — хотя бы один файл не распарсился, зависимости модуля
+    неизвестны и использовать граф для него нельзя.
+    Корневые ROOT_FILES (db.py) попадают в узел ROOT_NODE.
+    Результаты разбора кэшируются по хэшу файла в cache_path.
+    """
+    cache = fingerprint.load_json(cache_path) if cache_path else {}
+    if cache.get("version") != CACHE_VERSION:
+        cache = {"version": CACHE_VERSION, "files": {}}
+    cached_files = cache["files"]
+    new_files = {}
+
+    module_names = {m['name'] for m in modules}
+    # `from db import db` — импорт корневого файла, а не внешнего пакета
+    root_names = {os.path.splitext(name)[0] for name in ROOT_FILES}
+    graph = {}
+    parsed_count = 0
+
+    nodes = [(m['name'], iter_module_files(source_path, m['path'])) for m in modules]
+    nodes.append((ROOT_NODE, iter_root_files(source_path)))
+    for node_name, files in nodes:
+        imported = set()
+        complete = True
+        for full_path, rel_file in files:
+            digest = fingerprint.file_hash(full_path, stat_cache)
+            entry = cached_files.get(rel_file)
+            if not entry or entry.get("hash") != digest:
+                parsed_count += 1
+                try:
+                    entry = {"hash": digest, "imports": parse_imports(full_path, rel_file), "ok": True}
+                except (SyntaxError, ValueError) as e:
+                    print(f"⚠️ [ANALYZER] Не удалось разобрать {rel_file}: {e}")
+                    entry = {"hash": digest, "imports": [], "ok": False}
+            new_files[rel_file] = entry
+            imported.update(entry["imports"])
+            complete = complete and entry["ok"]
+
+        graph[node_name] = {
+            "imports": sorted(imported & module_names - {node_name}),
+            "external": sorted(imported - module_names - root_names - {node_name}),
+            "complete": complete,
+        }
+
+    if cache_path:
+        fingerprint.save_json(cache_path, {"version": CACHE_VERSION, "files": new_files})
+
+    print(f"🧠 [ANALYZER] Граф импортов построен: модулей {len(graph) - 1}, разобрано файлов {parsed_count} из {len(new_files)}")
+    return graph
+
+
+def resolve_service_dependencies(graph, service_name, modules):
+    """
+    Какие заглушки и общие библиотеки реально нужны сервису.
+    Общие библиотеки обходятся транзитивно (их код копируется целиком),
+    другие сервисы заменяются заглушками и дальше не раскрываются.
+    Обход начинается и с ROOT_NODE: db.py копируется в каждый сервис.
+    external — внешние (не из монолита) импорты сервиса и его общих
+    библиотек. Если граф неполон — возвращается всё, как раньше, а
+    external=None (набор внешних пакетов неизвестен).
+    """
+    module_types = {m['name']: m.get('type') for m in modules}
+    all_stubs = sorted(n for n, t in module_types.items() if t != 'shared' and n != service_name)
+    all_shared = sorted(n for n, t in module_types.items() if t == 'shared')
+
+    stubs, shared, external = set(), set(), set()
+    queue = [service_name, ROOT_NODE] if ROOT_NODE in graph else [service_name]
+    visited = set()
+    while queue:
+        name = queue.pop()
+        if name in visited:
+            continue
+        visited.add(name)
+        node = graph.get(name)
+        if node is None or not node["complete"]:
+            return {"stubs": all_stubs, "shared": all_shared, "external": None}
+        external.update(node["external"])
+        for dep in node["imports"]:
+            if dep == service_name:
+                continue
+            if module_types.get(dep) == 'shared':
+                shared.add(dep)
+                queue.append(dep)
+            else:
+                stubs.add(dep)
+
+    return {"stubs": sorted(stubs), "shared": sorted(shared), "external": sorted(external)}
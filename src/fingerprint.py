@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+SKIP_DIRS = {'__pycache__'}
+
+
+class StatCache:
+    """
+    Хэши файлов между запусками: {path: [size, mtime_ns, digest]}.
+    Если размер и mtime не изменились, файл не перечитывается.
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self._entries = load_json(cache_path) if cache_path else {}
+        self._used = {}
+
+    def get(self, file_path, st):
+        cached = self._entries.get(file_path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            self._used[file_path] = cached
+            return cached[2]
+        return None
+
+    def put(self, file_path, st, digest):
+        self._entries[file_path] = self._used[file_path] = [st.st_size, st.st_mtime_ns, digest]
+
+    def save(self):
+        """Сохраняет только записи, использованные в этом прогоне (удалённые файлы выпадают)."""
+        if self.cache_path:
+            save_json(self.cache_path, self._used)
+
+
+def file_hash(file_path, stat_cache=None):
+    """Хэш содержимого файла; stat_cache — StatCache или None."""
+    st = os.stat(file_path)
+    if stat_cache is not None:
+        digest = stat_cache.get(file_path, st)
+        if digest:
+            return digest
+
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if stat_cache is not None:
+        stat_cache.put(file_path, st, digest)
+    return digest
+
+
+def tree_hash(dir_path, stat_cache=None):
+    """Хэш дерева файлов: учитывает относительные пути и содержимое."""
+    if not os.path.exists(dir_path):
+        return None
+    if os.path.isfile(dir_path):
+        return file_hash(dir_path, stat_cache)
+
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(dir_path):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(files):
+            if name.endswith('.pyc'):
+                continue
+            full_path = os.path.join(root, name)
+            rel_path = os.path.relpath(full_path, dir_path).replace(os.sep, '/')
+            h.update(rel_path.encode('utf-8'))
+            h.update(b'\0')
+            h.update(file_hash(full_path, stat_cache).encode('ascii'))
+            h.update(b'\n')
+    return h.hexdigest()
+
+
+def load_json(path, default=None):
+    """Читает JSON-кэш; битый или отсутствующий файл даёт default."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {} if default is None else default
+
+
+def save_json(path, data):
+    """Атомарно сохраняет JSON (через временный файл)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
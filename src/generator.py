@@ -1,41 +1,50 @@
 
-import re
+import io
 import os
+import stat
 import shutil
-from jinja2 import Environment, FileSystemLoader
+import tarfile
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import scanner
+import analyzer
+import sanitizer
+import fingerprint
+import profiler
 
-def sanitize_models(service_dir):
-    print(f"🧹 Очистка моделей в {service_dir}...")
-    for root, _, files in os.walk(service_dir):
-        for file in files:
-            if file.endswith(".py"):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                new_content = re.sub(r",\s*db\.ForeignKey\([^)]+\)", "", content)
-                new_content = re.sub(r"^\s*\w+\s*=\s*db\.relationship\(.+\).*$", "", new_content, flags=re.MULTILINE)
-                
-                if content != new_content:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(new_content)
-
-def create_stubs(service_build_dir, all_modules, current_service_name):
-    for module in all_modules:
-        mod_name = module['name']
-        if mod_name == current_service_name or module.get('type') == 'shared':
-            continue
-            
-        stub_dir = os.path.join(service_build_dir, mod_name)
-        if not os.path.exists(stub_dir):
-            os.makedirs(stub_dir)
-            
-            with open(os.path.join(stub_dir, "__init__.py"), "w") as f:
-                f.write(f"# Stub for {mod_name}\n")
-            
-            with open(os.path.join(stub_dir, "models.py"), "w") as f:
-                f.write("""
+CACHE_DIR_NAME = ".amm_cache"
+MANIFEST_FILE = "manifest.json"
+FILE_HASHES_FILE = "file_hashes.json"
+IMPORTS_CACHE_FILE = "imports.json"
+SANITIZE_CACHE_FILE = "sanitize.json"
+SHARED_DIR_NAME = "_shared"
+WHEELHOUSE_REQUIREMENTS_FILE = "requirements-wheelhouse.txt"
+MANIFEST_VERSION = 7
+
+SHARED_MODES = ("copy", "hardlink", "context")
+SERVERS = ("gunicorn", "dev")
+SERVER_REQUIREMENTS = {"gunicorn": ["gunicorn==21.2.0"], "dev": []}
+DEFAULT_THREADS = 4
+METRICS_REQUIREMENTS = ["prometheus-client==0.20.0"]
+# Соединения PostgreSQL, оставляемые под администрирование и миграции
+DB_RESERVED_CONNECTIONS = 10
+PGBOUNCER_MAX_CLIENT_CONN = 1000
+# Меньше соединений сервису не выделяется, сколько бы сервисов ни было
+DB_MIN_SERVICE_CONNECTIONS = 2
+# Опции генерации, влияющие на содержимое каталога сервиса (входят в манифест)
+OUTPUT_FORMATS = ("dir", "tar")
+BUILD_SCRIPT_FILE = "build_images.sh"
+FINGERPRINT_OPTIONS = ("shared_mode", "wheelhouse_requirements", "server", "db_connection_budget", "metrics", "prune_requirements", "output_format", "outbox")
+
+BASE_REQUIREMENTS = [
+    "requests==2.31.0",
+    "Flask==3.0.0",
+    "Flask-SQLAlchemy==3.1.1",
+    "psycopg2-binary==2.9.9",
+]
+
+STUB_MODELS_SOURCE = """
 import sys
 
 class Stub:
@@ -52,105 +61,831 @@ class Stub:
         return iter([])
 
 sys.modules[__name__] = Stub()
-""")
-                
-def render_service(module_info, all_modules, all_deps_map, output_path, template_env, source_path):
+"""
+
+def create_stubs(sink, all_modules, current_service_name, only=None):
+    """
+    Заглушки модулей в контексте сервиса (sink — см. FilesystemOutput.open_service).
+    only — имена модулей, для которых нужны заглушки (None — для всех).
+    """
+    for module in all_modules:
+        mod_name = module['name']
+        if mod_name == current_service_name or module.get('type') == 'shared':
+            continue
+        if only is not None and mod_name not in only:
+            continue
+            
+        if not sink.exists(mod_name):
+            sink.write(f"{mod_name}/__init__.py", f"# Stub for {mod_name}\n")
+            sink.write(f"{mod_name}/models.py", STUB_MODELS_SOURCE)
+
+def collect_requirements(module_info, all_deps_map, server="gunicorn", metrics=False, prune=False):
+    """
+    Итоговый (отсортированный) список зависимостей сервиса.
+    prune=True — из зависимостей монолита (корневых и модуля) остаются только
+    импортируемые сервисом, его общими библиотеками и копируемым в каждый
+    сервис db.py (module_info['external'] от анализатора). Базовые, серверные
+    и метрики остаются всегда.
+    """
+    final_deps = set(BASE_REQUIREMENTS)
+    final_deps.update(SERVER_REQUIREMENTS[server])
+    if metrics:
+        final_deps.update(METRICS_REQUIREMENTS)
+    project_deps = set()
+    if '.' in all_deps_map: project_deps.update(all_deps_map['.'])
+    if module_info['path'] in all_deps_map: project_deps.update(all_deps_map[module_info['path']])
+    if prune and module_info.get('external') is not None:
+        project_deps = scanner.prune_requirements(project_deps, module_info['external'])[0]
+    final_deps.update(project_deps)
+    return sorted(final_deps)
+
+def build_wheelhouse(requirements_by_service, log=print):
+    """
+    Общий набор колёс для всех сервисов: объединение их зависимостей.
+    Пакеты, закреплённые в разных сервисах по-разному, и строки, которые не
+    являются требованиями (опции pip, ссылки), в wheelhouse не попадают.
+    """
+    specs_by_name = {}
+    for requirements in requirements_by_service.values():
+        for requirement in requirements:
+            name = scanner.requirement_name(requirement)
+            if name:
+                specs_by_name.setdefault(name, set()).add(requirement)
+
+    wheelhouse = []
+    for name, specs in sorted(specs_by_name.items()):
+        if len(specs) > 1:
+            log(f"⚠️ Конфликт версий {name}: {', '.join(sorted(specs))} — пакет ставится в сервисах отдельно")
+            continue
+        wheelhouse.extend(specs)
+    return sorted(wheelhouse)
+
+def db_connection_budget(services_count, db_max_connections, pgbouncer):
+    """
+    Сколько соединений к БД может держать один сервис (все его воркеры вместе).
+    Без PgBouncer делим max_connections PostgreSQL, с ним — лимит клиентов пулера.
+    """
+    total = PGBOUNCER_MAX_CLIENT_CONN if pgbouncer else db_max_connections - DB_RESERVED_CONNECTIONS
+    return max(DB_MIN_SERVICE_CONNECTIONS, total // max(1, services_count))
+
+def postgres_max_connections(services_count, db_max_connections, pgbouncer):
+    """
+    max_connections для postgres в docker-compose. Бюджет сервиса не меньше
+    DB_MIN_SERVICE_CONNECTIONS, поэтому при большом числе сервисов без
+    PgBouncer их сумма может превысить db_max_connections — тогда лимит
+    поднимается до этой суммы (плюс резерв), иначе postgres начнёт отказывать.
+    """
+    if pgbouncer:
+        return db_max_connections
+    needed = services_count * db_connection_budget(services_count, db_max_connections, pgbouncer) + DB_RESERVED_CONNECTIONS
+    return max(db_max_connections, needed)
+
+def templates_fingerprint(templates_dir):
+    return fingerprint.tree_hash(templates_dir)
+
+def service_fingerprint(module_info, all_modules, all_deps_map, source_path, templates_hash, stat_cache, options=None):
+    """
+    Описание всех входов сервиса для манифеста: исходники, общие библиотеки,
+    шаблоны, набор зависимостей и заглушек. Если описание совпадает с
+    предыдущим запуском — сервис можно не пересобирать.
+    """
+    shared = {}
+    for module in service_shared_libs(module_info, all_modules):
+        shared[module['name']] = fingerprint.tree_hash(os.path.join(source_path, module['name']), stat_cache)
+
+    return {
+        "source": fingerprint.tree_hash(os.path.join(source_path, module_info['path']), stat_cache),
+        "db": fingerprint.tree_hash(os.path.join(source_path, 'db.py'), stat_cache),
+        "shared": shared,
+        "templates": templates_hash,
+        "dependencies": collect_requirements(
+            module_info, all_deps_map, (options or {}).get('server', 'gunicorn'), (options or {}).get('metrics', False),
+            (options or {}).get('prune_requirements', False)
+        ),
+        "stubs": module_info.get('stubs', sorted(m['name'] for m in all_modules if m['name'] != module_info['name'] and m.get('type') != 'shared')),
+        "services": sorted(m['name'] for m in all_modules if m.get('type') == 'service'),
+        "options": {key: (options or {}).get(key) for key in FINGERPRINT_OPTIONS},
+    }
+
+def load_manifest(output_path):
+    manifest = fingerprint.load_json(os.path.join(output_path, CACHE_DIR_NAME, MANIFEST_FILE))
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "services": {}}
+    return manifest
+
+def save_manifest(output_path, manifest):
+    fingerprint.save_json(os.path.join(output_path, CACHE_DIR_NAME, MANIFEST_FILE), manifest)
+
+def clean_output(output_path):
+    """Полная очистка docker_out (кэш .amm_cache сохраняется)."""
+    if not os.path.exists(output_path):
+        return
+    for entry in os.scandir(output_path):
+        if entry.name == CACHE_DIR_NAME:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+def write_if_changed(file_path, content):
+    """Пишет файл только при изменении содержимого (mtime не трогается зря)."""
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+class FilesystemOutput:
+    """
+    Вывод по умолчанию: контекст каждого сервиса — каталог docker_out/<сервис>,
+    docker compose собирает образы из этих каталогов.
+    """
+    format = "dir"
+
+    def __init__(self, output_path, report=None):
+        self.output_path = output_path
+        self.report = report or profiler.NULL_REPORT
+
+    def service_path(self, name):
+        return os.path.join(self.output_path, name)
+
+    def exists(self, name):
+        return os.path.isdir(self.service_path(name))
+
+    def remove(self, name):
+        if os.path.exists(self.service_path(name)):
+            shutil.rmtree(self.service_path(name))
+
+    def open_service(self, name):
+        """Контекст сервиса собирается с нуля."""
+        self.remove(name)
+        os.makedirs(self.service_path(name))
+        return FilesystemSink(self.service_path(name), name, self.report)
+
+class FilesystemSink:
+    def __init__(self, root, service_name, report):
+        self.root = root
+        self.service_name = service_name
+        self.report = report
+
+    def exists(self, rel):
+        return os.path.exists(os.path.join(self.root, rel))
+
+    def write(self, rel, content):
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb" if isinstance(content, bytes) else "w") as f:
+            f.write(content)
+        self.report.count(self.service_name, "written")
+
+    def _copy_function(self, transform=None, link=False):
+        base = link_or_copy if link else shutil.copy2
+
+        def copy(src, dst):
+            data = transform(src) if transform else None
+            if data is None:
+                return base(src, dst)
+            with open(dst, "wb") as f:
+                f.write(data)
+            shutil.copystat(src, dst)
+            return dst
+        return self.report.counting(copy, self.service_name, "linked" if link else "copied")
+
+    def add_file(self, src, rel, link=False, transform=None):
+        self._copy_function(transform, link)(src, os.path.join(self.root, rel))
+
+    def add_tree(self, src, rel, transform=None, link=False):
+        """
+        Дерево src в контекст; transform(путь) -> bytes | None позволяет
+        подменить содержимое файла (None — файл копируется как есть).
+        Если transform уже прочитал файл, он возвращает его байты, даже
+        неизменённые, — они пишутся без повторного чтения.
+        """
+        shutil.copytree(src, os.path.join(self.root, rel), copy_function=self._copy_function(transform, link), dirs_exist_ok=True)
+
+    def close(self):
+        pass
+
+class TarOutput:
+    """
+    Контекст каждого сервиса — архив docker_out/<сервис>.tar без
+    промежуточного дерева на диске: docker build -t <сервис> - < <сервис>.tar.
+    Архив детерминирован: имена отсортированы, mtime/владелец фиксированы
+    (mtime берётся из SOURCE_DATE_EPOCH, иначе 0), поэтому при неизменных
+    входах совпадает байт в байт и не сбивает кэш слоёв.
+    """
+    format = "tar"
+
+    def __init__(self, output_path, report=None):
+        self.output_path = output_path
+        self.report = report or profiler.NULL_REPORT
+        self.mtime = int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+
+    def service_path(self, name):
+        return os.path.join(self.output_path, f"{name}.tar")
+
+    def exists(self, name):
+        return os.path.isfile(self.service_path(name))
+
+    def remove(self, name):
+        if os.path.exists(self.service_path(name)):
+            os.remove(self.service_path(name))
+
+    def open_service(self, name):
+        return TarSink(self, name)
+
+class TarSink:
+    def __init__(self, output, service_name):
+        self.output = output
+        self.service_name = service_name
+        self.report = output.report
+        # имя в архиве -> (путь к файлу | None, содержимое | None, исполняемый)
+        self.entries = {}
+        self.dirs = set()
+
+    def _add(self, rel, path=None, data=None, executable=False):
+        rel = rel.replace(os.sep, "/")
+        self.entries[rel] = (path, data, executable)
+        parent = os.path.dirname(rel)
+        while parent:
+            self.dirs.add(parent)
+            parent = os.path.dirname(parent)
+
+    def exists(self, rel):
+        rel = rel.replace(os.sep, "/")
+        return rel in self.entries or rel in self.dirs
+
+    def write(self, rel, content):
+        self._add(rel, data=content.encode("utf-8") if isinstance(content, str) else content)
+        self.report.count(self.service_name, "written")
+
+    def add_file(self, src, rel, link=False, transform=None):
+        data = transform(src) if transform else None
+        st = os.stat(src)
+        self._add(rel, path=None if data is not None else src, data=data, executable=bool(st.st_mode & stat.S_IXUSR))
+        self.report.count(self.service_name, "copied", 1, st.st_size)
+
+    def add_tree(self, src, rel, transform=None, link=False):
+        """
+        Как copytree в каталожном выводе: ссылки на каталоги раскрываются.
+        Ссылка на каталог выше по тому же пути (цикл) — ошибка.
+        """
+        ancestors = {src: set()}
+        for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+            dirnames.sort()
+            st = os.stat(dirpath)
+            path_keys = ancestors.pop(dirpath) | {(st.st_dev, st.st_ino)}
+            for name in dirnames:
+                child = os.path.join(dirpath, name)
+                child_st = os.stat(child)
+                if (child_st.st_dev, child_st.st_ino) in path_keys:
+                    raise OSError(f"Цикл символических ссылок: {child}")
+                ancestors[child] = path_keys
+            rel_dir = os.path.join(rel, os.path.relpath(dirpath, src)) if dirpath != src else rel
+            self.dirs.add(os.path.normpath(rel_dir).replace(os.sep, "/"))
+            for name in sorted(filenames):
+                self.add_file(os.path.join(dirpath, name), os.path.join(rel_dir, name), transform=transform)
+
+    def _info(self, name, is_dir=False, size=0, executable=False):
+        info = tarfile.TarInfo(name)
+        info.mtime = self.output.mtime
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        if is_dir:
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+        else:
+            info.size = size
+            info.mode = 0o755 if executable else 0o644
+        return info
+
+    def _write_archive(self, stream):
+        with tarfile.open(fileobj=stream, mode="w|", format=tarfile.GNU_FORMAT) as archive:
+            names = sorted(self.dirs | set(self.entries))
+            for name in names:
+                if name not in self.entries:
+                    archive.addfile(self._info(name, is_dir=True))
+                    continue
+                path, data, executable = self.entries[name]
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                archive.addfile(self._info(name, size=len(data), executable=executable), io.BytesIO(data))
+
+    def close(self):
+        target = self.output.service_path(self.service_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            self._write_archive(f)
+        os.replace(tmp_path, target)
+
+def create_output(output_format, output_path, report=None):
+    if output_format == "tar":
+        return TarOutput(output_path, report)
+    return FilesystemOutput(output_path, report)
+
+def remove_service_output(output_path, name):
+    """Удаляет контекст сервиса в любом формате. True — было что удалять."""
+    removed = False
+    for output in (FilesystemOutput(output_path), TarOutput(output_path)):
+        if output.exists(name):
+            output.remove(name)
+            removed = True
+    return removed
+
+def render_service(module_info, all_modules, all_deps_map, output_path, template_env, source_path, log=print, options=None, sink=None):
+    """
+    Контекст сборки сервиса: очищенный код, заглушки, шаблоны.
+    sink — куда писать (open_service выходного бэкенда); по умолчанию —
+    каталог docker_out/<сервис>, который тогда и закрывается здесь же.
+    """
+    options = options or {}
+    report = options.get('report') or profiler.NULL_REPORT
     service_name = module_info['name']
     service_rel_path = module_info['path']
-    
-    service_build_dir = os.path.join(output_path, service_name)
-    os.makedirs(service_build_dir, exist_ok=True)
+    own_sink = sink is None
+    if own_sink:
+        sink = (options.get('output') or FilesystemOutput(output_path, report)).open_service(service_name)
     
     abs_source_path = os.path.join(source_path, service_rel_path)
-    service_code_dest = os.path.join(service_build_dir, service_name)
-    
-    if os.path.exists(service_code_dest): 
-        shutil.rmtree(service_code_dest)
-    if os.path.exists(abs_source_path):
-        shutil.copytree(abs_source_path, service_code_dest)
     
-    sanitize_models(service_build_dir)
+    with report.phase("copy_code", service_name):
+        if os.path.exists(abs_source_path):
+            # код копируется и очищается за один проход по файлам
+            changed, timings = [], {}
+            transform = partial(sanitizer.sanitized_file_bytes, cache=options.get('sanitizer_cache'), stats=changed, timings=timings)
+            sink.add_tree(abs_source_path, service_name, transform)
+            report.add_time("sanitize", timings.get('sanitize', 0.0), service_name)
+            log(f"🧹 Очистка моделей в {service_name}: изменено файлов {len(changed)}")
 
-    if not os.path.exists(os.path.join(service_code_dest, "__init__.py")):
-        with open(os.path.join(service_code_dest, "__init__.py"), "w") as f: f.write("")
+        if not sink.exists(f"{service_name}/__init__.py"):
+            sink.write(f"{service_name}/__init__.py", "")
 
-    create_stubs(service_build_dir, all_modules, service_name)
+    with report.phase("stubs", service_name):
+        create_stubs(sink, all_modules, service_name, module_info.get('stubs'))
 
-    api_bridge_content = template_env.get_template("api_bridge.jinja2").render(service_name=service_name)
-    with open(os.path.join(service_build_dir, "api_bridge.py"), "w") as f:
-        f.write(api_bridge_content)
+    with report.phase("render", service_name):
+        _render_templates(module_info, all_modules, all_deps_map, template_env, source_path, options, sink.write, log)
 
-    client_content = template_env.get_template("http_client.jinja2").render()
-    with open(os.path.join(service_build_dir, "http_client.py"), "w") as f:
-        f.write(client_content)
+    if own_sink:
+        sink.close()
 
-    final_deps = set()
-    if '.' in all_deps_map: final_deps.update(all_deps_map['.'])
-    if service_rel_path in all_deps_map: final_deps.update(all_deps_map[service_rel_path])
-    
-    final_deps.add("requests==2.31.0")
-    final_deps.add("Flask==3.0.0")
-    final_deps.add("Flask-SQLAlchemy==3.1.1")
-    final_deps.add("psycopg2-binary==2.9.9")
-    
-    with open(os.path.join(service_build_dir, "requirements.txt"), "w") as f:
-        f.write("\n".join(sorted(final_deps)))
+def _render_templates(module_info, all_modules, all_deps_map, template_env, source_path, options, write, log=print):
+    report = options.get('report') or profiler.NULL_REPORT
+    service_name = module_info['name']
+
+    write("api_bridge.py", template_env.get_template("api_bridge.jinja2").render(service_name=service_name))
+
+    metrics = options.get('metrics', False)
+    if metrics:
+        write("metrics.py", template_env.get_template("metrics.jinja2").render(service_name=service_name))
+
+    outbox = options.get('outbox', False)
+    if outbox:
+        write("outbox.py", template_env.get_template("outbox.jinja2").render(service_name=service_name))
+
+    write("http_client.py", template_env.get_template("http_client.jinja2").render(metrics=metrics, outbox=outbox))
+
+    server = options.get('server', 'gunicorn')
+    prune = options.get('prune_requirements', False)
+    final_deps = collect_requirements(module_info, all_deps_map, server, metrics, prune)
+    write("requirements.txt", "\n".join(final_deps))
+    if prune:
+        dropped = sorted(set(collect_requirements(module_info, all_deps_map, server, metrics)) - set(final_deps))
+        report.service(service_name)["requirements_dropped"] = dropped
+        if dropped:
+            log(f"✂️  Зависимости {service_name}: не импортируются, убраны — {', '.join(dropped)}")
+
+    wheelhouse = options.get('wheelhouse_requirements')
+    if wheelhouse is not None:
+        # файл одинаков во всех сервисах — BuildKit собирает стадию колёс один раз
+        write(WHEELHOUSE_REQUIREMENTS_FILE, "\n".join(wheelhouse))
 
     runnable_services = [m for m in all_modules if m.get('type') == 'service']
     services_map = {m['name']: f"http://{m['name']}:5000" for m in runnable_services}
     
     entry_content = template_env.get_template("entrypoint.jinja2").render(
         service_name=service_name,
-        services_map=services_map
+        services_map=services_map,
+        server=server,
+        threads=DEFAULT_THREADS,
+        db_connection_budget=options.get('db_connection_budget', 10),
+        metrics=metrics,
+        outbox=outbox
     )
-    with open(os.path.join(service_build_dir, "run.py"), "w") as f:
-        f.write(entry_content)
+    write("run.py", entry_content)
+
+    if server == 'gunicorn':
+        gunicorn_content = template_env.get_template("gunicorn.conf.jinja2").render(
+            service_name=service_name,
+            threads=DEFAULT_THREADS,
+            db_connection_budget=options.get('db_connection_budget', 10),
+            metrics=metrics
+        )
+        write("gunicorn.conf.py", gunicorn_content)
+
+    shared_mode = options.get('shared_mode', 'copy')
+    docker_content = template_env.get_template("Dockerfile.jinja2").render(
+        service_name=service_name,
+        shared_context=shared_mode == 'context',
+        server=server,
+        metrics=metrics,
+        wheelhouse=wheelhouse is not None,
+        wheelhouse_file=WHEELHOUSE_REQUIREMENTS_FILE,
+        offline_install=wheelhouse is not None and set(final_deps) <= set(wheelhouse),
+        shared_libs=[m['name'] for m in service_shared_libs(module_info, all_modules)],
+        has_db=os.path.exists(os.path.join(source_path, 'db.py'))
+    )
+    write("Dockerfile", docker_content)
+
+def copy_shared_code(sink, shared_libs, source_path):
+    db_path = os.path.join(source_path, 'db.py')
+    if os.path.exists(db_path): 
+        sink.add_file(db_path, 'db.py')
+    
+    for shared in shared_libs:
+        shared_src = os.path.join(source_path, shared['name'])
+        if os.path.exists(shared_src):
+            sink.add_tree(shared_src, shared['name'])
+
+def link_or_copy(src, dst):
+    """Жёсткая ссылка вместо копии; если ФС не умеет — обычное копирование."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+def sync_file(src, dst):
+    """Копирует файл, только если он отличается по размеру или mtime."""
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    if os.path.exists(dst):
+        st, dst_st = os.stat(src), os.stat(dst)
+        if st.st_size == dst_st.st_size and st.st_mtime_ns == dst_st.st_mtime_ns:
+            return
+        os.remove(dst)  # не пишем поверх: файл может быть жёсткой ссылкой
+    shutil.copy2(src, dst)
+
+def sync_tree(src, dst):
+    """
+    Приводит dst к виду src: копируются только отличающиеся по размеру/mtime
+    файлы, лишние удаляются. Неизменённые файлы не трогаются.
+    """
+    os.makedirs(dst, exist_ok=True)
+    src_names = set()
+    for entry in os.scandir(src):
+        if entry.name == '__pycache__':
+            continue
+        src_names.add(entry.name)
+        target = os.path.join(dst, entry.name)
+        if entry.is_dir():
+            if os.path.isfile(target):
+                os.remove(target)
+            sync_tree(entry.path, target)
+            continue
+        sync_file(entry.path, target)
+
+    for name in os.listdir(dst):
+        if name not in src_names:
+            target = os.path.join(dst, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            else:
+                os.remove(target)
+
+def stage_shared_code(output_path, shared_libs, source_path):
+    """
+    Один экземпляр общего кода (db.py и shared-библиотеки) в docker_out/_shared.
+    Из него сервисы получают жёсткие ссылки (hardlink) или он подключается
+    к сборке как именованный контекст (context).
+    """
+    stage_dir = os.path.join(output_path, SHARED_DIR_NAME)
+    os.makedirs(stage_dir, exist_ok=True)
+    wanted = set()
+
+    db_path = os.path.join(source_path, 'db.py')
+    if os.path.exists(db_path):
+        wanted.add('db.py')
+        sync_file(db_path, os.path.join(stage_dir, 'db.py'))
+
+    for shared in shared_libs:
+        shared_src = os.path.join(source_path, shared['name'])
+        if os.path.exists(shared_src):
+            wanted.add(shared['name'])
+            sync_tree(shared_src, os.path.join(stage_dir, shared['name']))
 
-    docker_content = template_env.get_template("Dockerfile.jinja2").render(service_name=service_name)
-    with open(os.path.join(service_build_dir, "Dockerfile"), "w") as f:
-        f.write(docker_content)
+    for name in os.listdir(stage_dir):
+        if name not in wanted:
+            target = os.path.join(stage_dir, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            else:
+                os.remove(target)
+    return stage_dir
 
-def run_generation(source_path=None, output_path=None):
+def link_shared_code(sink, shared_libs, stage_dir):
+    """Общий код в каталог сервиса жёсткими ссылками из docker_out/_shared."""
+    db_path = os.path.join(stage_dir, 'db.py')
+    if os.path.exists(db_path):
+        sink.add_file(db_path, 'db.py', link=True)
+
+    for shared in shared_libs:
+        shared_src = os.path.join(stage_dir, shared['name'])
+        if os.path.exists(shared_src):
+            sink.add_tree(shared_src, shared['name'], link=True)
+
+def service_shared_libs(module_info, all_modules):
+    """Общие библиотеки сервиса: по графу импортов, если он есть, иначе все."""
+    shared_libs = [m for m in all_modules if m.get('type') == 'shared']
+    if 'shared' in module_info:
+        shared_libs = [m for m in shared_libs if m['name'] in module_info['shared']]
+    return shared_libs
+
+def build_service(module, all_modules, all_deps_map, output_path, template_env, source_path, log=print, options=None):
+    """Полная сборка контекста одного сервиса: код, шаблоны, общие библиотеки."""
+    options = options or {}
+    report = options.get('report') or profiler.NULL_REPORT
+    output = options.get('output') or FilesystemOutput(output_path, report)
+    sink = output.open_service(module['name'])
+    render_service(module, all_modules, all_deps_map, output_path, template_env, source_path, log, options, sink)
+
+    shared_libs = service_shared_libs(module, all_modules)
+    shared_mode = options.get('shared_mode', 'copy')
+    with report.phase("shared", module['name']):
+        if shared_mode == 'hardlink':
+            link_shared_code(sink, shared_libs, os.path.join(output_path, SHARED_DIR_NAME))
+        elif shared_mode == 'copy':
+            copy_shared_code(sink, shared_libs, source_path)
+        # context: общий код приходит в образ из именованного контекста сборки
+
+    with report.phase("write_context", module['name']):
+        sink.close()
+
+def _build_service_task(module, all_modules, all_deps_map, output_path, template_env, source_path, options):
+    """
+    Задача для пула потоков: логи буферизуются, исключение не выходит
+    наружу — ошибка одного сервиса не ломает остальные.
+    """
+    lines = []
+    try:
+        build_service(module, all_modules, all_deps_map, output_path, template_env, source_path, lines.append, options)
+        return lines, None
+    except Exception as e:
+        return lines, e
+
+def resolve_workers(workers):
+    """workers <= 0 или None — по числу ядер."""
+    if not workers or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+def run_generation(source_path=None, output_path=None, incremental=False, workers=1, analyze_imports=True,
+                   shared_mode="copy", wheelhouse=False, server="gunicorn", pgbouncer=False,
+                   db_max_connections=100, metrics=False, profile=False, prune_requirements=False,
+                   output_format="dir", outbox=False):
+    """
+    incremental=True — пересобираются только сервисы, у которых изменились
+    входы (исходники, общие библиотеки, шаблоны, зависимости). Файлы
+    остальных сервисов в docker_out не трогаются.
+    workers — число потоков для параллельной сборки сервисов
+    (1 — последовательно, 0 — по числу ядер). Логи выводятся в порядке сервисов.
+    analyze_imports=True — по графу импортов (analyzer) в сервис попадают
+    только те заглушки и общие библиотеки, которые он реально импортирует.
+    shared_mode — как общий код (db.py и shared-библиотеки) попадает в сервисы:
+        "copy"     — копия в каждый сервис (по умолчанию);
+        "hardlink" — один экземпляр в docker_out/_shared, в сервисах жёсткие ссылки;
+        "context"  — один экземпляр в docker_out/_shared, подключается к сборке
+                     как additional_contexts (BuildKit) и не дублируется на диске.
+    wheelhouse=True — Dockerfile собирает колёса для объединения зависимостей
+    всех сервисов в общей стадии (одинаковой во всех образах, поэтому BuildKit
+    строит её один раз) и ставит их офлайн через --find-links с кэшем pip.
+    server — "gunicorn" (продакшен, воркеры по лимиту CPU) или "dev" (встроенный сервер Flask).
+    pgbouncer=True — сервисы ходят в postgres через общий PgBouncer;
+    db_max_connections — max_connections postgres, от него считаются пулы SQLAlchemy.
+    metrics=True — сервисы отдают метрики Prometheus на /metrics.
+    prune_requirements=True — в requirements.txt сервиса из зависимостей монолита
+    остаются только пакеты, которые импортируют сам сервис и его общие
+    библиотеки (нужен analyze_imports); убранные пишутся в лог и отчёт.
+    output_format — в каком виде сохраняются контексты сборки сервисов:
+        "dir" — каталоги docker_out/<сервис> (по умолчанию);
+        "tar" — детерминированные архивы docker_out/<сервис>.tar без
+                промежуточного дерева (docker build -t <сервис> - < <сервис>.tar),
+                образы собирает docker_out/build_images.sh. Только с shared_mode="copy".
+    outbox=True — ServiceClient.update пишет в локальный SQLite-outbox сервиса,
+    фоновый поток доставляет обновления пачками через /internal/bulk_update
+    с повторами (доставка «хотя бы один раз»); outbox хранится в томе compose.
+    profile=True — запуск под cProfile (результат в docker_out/generation.prof);
+    сборка при этом последовательная, т.к. cProfile видит только свой поток.
+
+    Время фаз и объём скопированного пишутся в docker_out/generation_report.json.
+    """
     if not source_path or not os.path.exists(source_path):
         print("Ошибка: Путь к монолиту не указан")
         return
+    if shared_mode not in SHARED_MODES:
+        raise ValueError(f"Неизвестный shared_mode: {shared_mode} (допустимо: {', '.join(SHARED_MODES)})")
+    if server not in SERVERS:
+        raise ValueError(f"Неизвестный server: {server} (допустимо: {', '.join(SERVERS)})")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Неизвестный output_format: {output_format} (допустимо: {', '.join(OUTPUT_FORMATS)})")
+    if output_format == "tar" and shared_mode != "copy":
+        # в одном tar-потоке нет ни жёстких ссылок на docker_out/_shared, ни второго контекста
+        raise ValueError("output_format='tar' поддерживает только shared_mode='copy'")
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(current_dir)
     templates_dir = os.path.join(project_root, "templates")
-    
-    if os.path.exists(output_path): shutil.rmtree(output_path)
-    os.makedirs(output_path, exist_ok=True)
 
-    scan_result = scanner.scan_project_structure(source_path)
+    if profile and resolve_workers(workers) > 1:
+        print("🔬 Профилирование: cProfile видит только свой поток, сборка будет последовательной")
+        workers = 1
+    # Все настройки прогона — один словарь: он же идёт в отчёт и в _generate
+    settings = {
+        "incremental": incremental,
+        "workers": resolve_workers(workers),
+        "analyze_imports": analyze_imports,
+        "shared_mode": shared_mode,
+        "wheelhouse": wheelhouse,
+        "server": server,
+        "pgbouncer": pgbouncer,
+        "db_max_connections": db_max_connections,
+        "metrics": metrics,
+        "prune_requirements": prune_requirements,
+        "output_format": output_format,
+        "outbox": outbox,
+    }
+    report = profiler.GenerationReport(source_path, output_path, settings)
+
+    with report.phase("clean"):
+        if not incremental:
+            clean_output(output_path)
+        os.makedirs(output_path, exist_ok=True)
+
+    profile_path = os.path.join(output_path, profiler.PROFILE_FILE) if profile else None
+    with profiler.profiled(profile_path):
+        result = _generate(source_path, output_path, templates_dir, report, settings)
+
+    if profile_path:
+        report.extra["profile"] = profile_path
+        print(f"🔬 Профиль сохранён: {profile_path}")
+    result["report"] = report.write()
+    for line in report.summary_lines():
+        print(line)
+
+    if result["failed"]:
+        print(f"\n⚠️ Генерация завершена с ошибками: {', '.join(sorted(result['failed']))}")
+    else:
+        print("\n✅ Генерация завершена успешно!")
+    return result
+
+def _generate(source_path, output_path, templates_dir, report, settings):
+    """settings — словарь настроек из run_generation."""
+    incremental = settings["incremental"]
+    shared_mode = settings["shared_mode"]
+    server = settings["server"]
+    pgbouncer = settings["pgbouncer"]
+    db_max_connections = settings["db_max_connections"]
+    metrics = settings["metrics"]
+    prune_requirements = settings["prune_requirements"]
+    output_format = settings["output_format"]
+    with report.phase("scan"):
+        scan_result = scanner.scan_project_structure(source_path, exclude=[output_path])
     all_deps_map = scan_result.get('dependencies', {})
     
     all_modules = scan_result.get('modules', [])
     runnable_services = [m for m in all_modules if m.get('type') == 'service']
-    shared_libs = [m for m in all_modules if m.get('type') == 'shared']
     
+    # jinja2 грузится только при генерации — импорт модуля остаётся лёгким (CLI, GUI)
+    from jinja2 import Environment, FileSystemLoader
     env = Environment(loader=FileSystemLoader(templates_dir))
-    
-    for module in runnable_services:
-        try:
-            render_service(module, all_modules, all_deps_map, output_path, env, source_path)
-        except Exception as e:
-            print(f"❌ Ошибка генерации сервиса {module['name']}: {e}")
-
-    for service in runnable_services:
-        service_dir = os.path.join(output_path, service['name'])
-        
-        db_path = os.path.join(source_path, 'db.py')
-        if os.path.exists(db_path): 
-            shutil.copy(db_path, os.path.join(service_dir, 'db.py'))
-        
-        for shared in shared_libs:
-            shared_src = os.path.join(source_path, shared['name'])
-            if os.path.exists(shared_src):
-                shutil.copytree(shared_src, os.path.join(service_dir, shared['name']), dirs_exist_ok=True)
-
-    compose_content = env.get_template("docker-compose.jinja2").render(services=runnable_services)
-    with open(os.path.join(output_path, "docker-compose.yaml"), "w") as f:
-        f.write(compose_content)
-
-    print("\n✅ Генерация завершена успешно!")
+
+    hashes_path = os.path.join(output_path, CACHE_DIR_NAME, FILE_HASHES_FILE)
+    stat_cache = fingerprint.StatCache(hashes_path)
+    templates_hash = templates_fingerprint(templates_dir)
+    old_manifest = load_manifest(output_path) if incremental else {"services": {}}
+    # опции сборки сервиса: настройки прогона плюс вычисленное по ним
+    options = dict(
+        settings,
+        sanitizer_cache=sanitizer.SanitizerCache(os.path.join(output_path, CACHE_DIR_NAME, SANITIZE_CACHE_FILE)),
+        wheelhouse_requirements=None,
+        db_connection_budget=db_connection_budget(len(runnable_services), db_max_connections, pgbouncer),
+        report=report,
+        output=create_output(output_format, output_path, report),
+    )
+    output = options["output"]
+    max_connections = postgres_max_connections(len(runnable_services), db_max_connections, pgbouncer)
+    if max_connections > db_max_connections:
+        print(f"⚠️ {len(runnable_services)} сервисам по {options['db_connection_budget']} соединений не хватает "
+              f"max_connections={db_max_connections}: в postgres будет max_connections={max_connections}. "
+              f"Для большого числа сервисов лучше --pgbouncer")
+    if settings["analyze_imports"]:
+        with report.phase("analyze"):
+            imports_cache = os.path.join(output_path, CACHE_DIR_NAME, IMPORTS_CACHE_FILE)
+            graph = analyzer.analyze_project(source_path, all_modules, imports_cache, stat_cache)
+            for module in runnable_services:
+                module.update(analyzer.resolve_service_dependencies(graph, module['name'], all_modules))
+    elif prune_requirements:
+        print("⚠️ prune_requirements работает только с analyze_imports=True — зависимости не урезаются")
+
+    if settings["wheelhouse"]:
+        with report.phase("wheelhouse"):
+            options["wheelhouse_requirements"] = build_wheelhouse(
+                {m['name']: collect_requirements(m, all_deps_map, server, metrics, prune_requirements) for m in runnable_services}
+            )
+    manifest = {"version": MANIFEST_VERSION, "services": {}}
+
+    services_to_build = []
+    with report.phase("fingerprint"):
+        for module in runnable_services:
+            inputs = service_fingerprint(module, all_modules, all_deps_map, source_path, templates_hash, stat_cache, options)
+            if incremental and old_manifest["services"].get(module['name']) == inputs and output.exists(module['name']):
+                print(f"⏭  Сервис {module['name']} не изменился, пропускаем")
+                manifest["services"][module['name']] = inputs
+                report.set_status(module['name'], "skipped")
+                continue
+            remove_service_output(output_path, module['name'])
+            services_to_build.append((module, inputs))
+
+        if incremental:
+            current_names = {m['name'] for m in runnable_services}
+            for stale_name in old_manifest["services"]:
+                if stale_name not in current_names and remove_service_output(output_path, stale_name):
+                    print(f"🗑  Удаляем устаревший сервис {stale_name}")
+
+    with report.phase("stage_shared"):
+        stage_dir = os.path.join(output_path, SHARED_DIR_NAME)
+        if shared_mode == "copy":
+            if os.path.exists(stage_dir):
+                shutil.rmtree(stage_dir)
+        else:
+            used_shared = {m['name'] for service in runnable_services for m in service_shared_libs(service, all_modules)}
+            stage_shared_code(output_path, [m for m in all_modules if m['name'] in used_shared], source_path)
+
+    result = {"built": [], "skipped": sorted(manifest["services"]), "failed": {}}
+    workers = min(settings["workers"], max(1, len(services_to_build)))
+
+    def on_done(module, inputs, error):
+        if error is None:
+            manifest["services"][module['name']] = inputs
+            result["built"].append(module['name'])
+            report.set_status(module['name'], "built")
+        else:
+            print(f"❌ Ошибка генерации сервиса {module['name']}: {error}")
+            result["failed"][module['name']] = str(error)
+            report.set_status(module['name'], "failed", str(error))
+
+    with report.phase("build"):
+        if workers == 1:
+            for module, inputs in services_to_build:
+                try:
+                    build_service(module, all_modules, all_deps_map, output_path, env, source_path, options=options)
+                    on_done(module, inputs, None)
+                except Exception as e:
+                    on_done(module, inputs, e)
+        else:
+            print(f"⚙️  Параллельная сборка: {len(services_to_build)} сервисов, потоков: {workers}")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    (module, inputs, pool.submit(_build_service_task, module, all_modules, all_deps_map, output_path, env, source_path, options))
+                    for module, inputs in services_to_build
+                ]
+                for module, inputs, future in futures:
+                    lines, error = future.result()
+                    for line in lines:
+                        print(line)
+                    on_done(module, inputs, error)
+
+    with report.phase("compose"):
+        compose_content = env.get_template("docker-compose.jinja2").render(
+            services=runnable_services,
+            shared_context=shared_mode == "context",
+            server=server,
+            pgbouncer=pgbouncer,
+            db_max_connections=max_connections,
+            pgbouncer_max_client_conn=PGBOUNCER_MAX_CLIENT_CONN,
+            pgbouncer_pool_size=max(1, db_max_connections - DB_RESERVED_CONNECTIONS),
+            prebuilt_images=output_format == "tar",
+            outbox=settings["outbox"]
+        )
+        write_if_changed(os.path.join(output_path, "docker-compose.yaml"), compose_content)
+        build_script = os.path.join(output_path, BUILD_SCRIPT_FILE)
+        if output_format == "tar":
+            script = env.get_template("build_images.jinja2").render(services=runnable_services)
+            if write_if_changed(build_script, script):
+                os.chmod(build_script, 0o755)
+        elif os.path.exists(build_script):
+            os.remove(build_script)
+
+    with report.phase("save_caches"):
+        save_manifest(output_path, manifest)
+        options["sanitizer_cache"].save()
+        stat_cache.save()
+
+    cache = options["sanitizer_cache"]
+    report.extra["sanitizer_cache"] = {"hits": cache.hits, "misses": cache.misses}
+    return result
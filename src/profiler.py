@@ -0,0 +1,164 @@
+import os
+import time
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+REPORT_FILE = "generation_report.json"
+PROFILE_FILE = "generation.prof"
+
+
+class GenerationReport:
+    """
+    Замеры одного запуска генератора: время фаз (общих и по сервисам),
+    число и объём скопированных файлов. Потокобезопасен — сервисы могут
+    собираться параллельно.
+    """
+
+    def __init__(self, source_path, output_path, options=None):
+        self.source_path = source_path
+        self.output_path = output_path
+        self.options = options or {}
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self._started = time.perf_counter()
+        self.phases = {}
+        self.services = {}
+        self.extra = {}
+        self._lock = threading.Lock()
+
+    def service(self, name):
+        with self._lock:
+            return self.services.setdefault(name, {
+                "status": None,
+                "phases": {},
+                "files_copied": 0,
+                "bytes_copied": 0,
+                "files_linked": 0,
+                "bytes_linked": 0,
+                "files_written": 0,
+            })
+
+    def add_time(self, phase, seconds, service=None):
+        target = self.service(service)["phases"] if service else self.phases
+        with self._lock:
+            target[phase] = round(target.get(phase, 0.0) + seconds, 6)
+
+    @contextmanager
+    def phase(self, name, service=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started, service)
+
+    def count(self, service, kind, files=1, size=0):
+        """kind: copied | linked | written."""
+        stats = self.service(service)
+        with self._lock:
+            stats[f"files_{kind}"] += files
+            if f"bytes_{kind}" in stats:
+                stats[f"bytes_{kind}"] += size
+
+    def counting(self, copy_function, service, kind="copied"):
+        """Обёртка над copy_function для copytree, считающая файлы и байты."""
+        def wrapper(src, dst, *args, **kwargs):
+            result = copy_function(src, dst, *args, **kwargs)
+            self.count(service, kind, 1, os.path.getsize(src))
+            return result
+        return wrapper
+
+    def set_status(self, service, status, error=None):
+        stats = self.service(service)
+        with self._lock:
+            stats["status"] = status
+            if error:
+                stats["error"] = error
+
+    def to_dict(self):
+        with self._lock:
+            services = {name: dict(stats) for name, stats in sorted(self.services.items())}
+            totals = {
+                key: sum(stats[key] for stats in services.values())
+                for key in ("files_copied", "bytes_copied", "files_linked", "bytes_linked", "files_written")
+            }
+            service_phases = {}
+            for stats in services.values():
+                for phase, seconds in stats["phases"].items():
+                    service_phases[phase] = round(service_phases.get(phase, 0.0) + seconds, 6)
+            return {
+                "source": os.path.abspath(self.source_path),
+                "output": os.path.abspath(self.output_path),
+                "started_at": self.started_at,
+                "total_seconds": round(time.perf_counter() - self._started, 6),
+                "options": self.options,
+                "phases": dict(self.phases),
+                "service_phases_total": service_phases,
+                "totals": totals,
+                "services": services,
+                **self.extra,
+            }
+
+    def write(self, path=None):
+        path = path or os.path.join(self.output_path, REPORT_FILE)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def summary_lines(self, top=5):
+        """Короткая сводка для лога: общие фазы и самые долгие фазы сервисов."""
+        data = self.to_dict()
+        lines = [f"⏱  Генерация: {data['total_seconds']:.2f} с"]
+        for phase, seconds in sorted(data["phases"].items(), key=lambda p: -p[1]):
+            lines.append(f"   {phase}: {seconds:.3f} с")
+        slowest = sorted(data["service_phases_total"].items(), key=lambda p: -p[1])[:top]
+        if slowest:
+            lines.append("   по сервисам (сумма): " + ", ".join(f"{p} {s:.3f} с" for p, s in slowest))
+        totals = data["totals"]
+        lines.append(
+            f"   скопировано: {totals['files_copied']} файлов / {totals['bytes_copied'] / 1024 / 1024:.1f} МБ, "
+            f"ссылок: {totals['files_linked']}, сгенерировано: {totals['files_written']}"
+        )
+        return lines
+
+
+class NullReport:
+    """Заглушка с тем же интерфейсом, когда замеры не нужны."""
+
+    def service(self, name):
+        return {}
+
+    def add_time(self, phase, seconds, service=None):
+        pass
+
+    @contextmanager
+    def phase(self, name, service=None):
+        yield
+
+    def count(self, service, kind, files=1, size=0):
+        pass
+
+    def counting(self, copy_function, service, kind="copied"):
+        return copy_function
+
+    def set_status(self, service, status, error=None):
+        pass
+
+
+NULL_REPORT = NullReport()
+
+
+@contextmanager
+def profiled(path=None):
+    """cProfile на время блока, результат — в path (для snakeviz / pstats). path=None — без профилирования."""
+    if not path:
+        yield
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
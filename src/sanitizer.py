@@ -0,0 +1,211 @@
+import re
+import ast
+import time
+import hashlib
+import threading
+import fingerprint
+
+# Быстрый фильтр: файл без этих маркеров заведомо не меняется
+MARKERS = (b"ForeignKey", b"relationship")
+# Меняется при изменении правил очистки — старые записи кэша становятся недействительны
+SANITIZER_VERSION = b"3"
+
+# Запасной путь для файлов, которые не парсятся ast (старое поведение)
+FK_RE = re.compile(r",\s*db\.ForeignKey\([^)]+\)")
+RELATIONSHIP_RE = re.compile(r"^\s*\w+\s*=\s*db\.relationship\(.+\).*$", re.MULTILINE)
+
+
+class SanitizerCache:
+    """
+    Кэш результатов очистки по хэшу исходного файла.
+    Значение — очищенный текст или None, если файл менять не нужно.
+    Потокобезопасен: один экземпляр используется всеми сервисами прогона.
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self._entries = fingerprint.load_json(cache_path) if cache_path else {}
+        self._used = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        with self._lock:
+            if digest in self._entries:
+                self.hits += 1
+                self._used[digest] = self._entries[digest]
+                return True, self._entries[digest]
+            self.misses += 1
+            return False, None
+
+    def put(self, digest, value):
+        with self._lock:
+            self._entries[digest] = value
+            self._used[digest] = value
+
+    def save(self):
+        """Сохраняет только записи, использованные в этом прогоне."""
+        if self.cache_path:
+            with self._lock:
+                fingerprint.save_json(self.cache_path, self._used)
+
+
+def _is_db_call(node, attr):
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == attr
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == 'db'
+    )
+
+
+def _statement_lists(node):
+    """Списки операторов узла: тело, else/finally (тела except — у самих обработчиков)."""
+    for field in ('body', 'orelse', 'finalbody'):
+        stmts = getattr(node, field, None)
+        if isinstance(stmts, list) and stmts:
+            yield stmts
+
+
+def _sanitize_ast(source):
+    """
+    Удаляет db.ForeignKey(...) из аргументов и присваивания db.relationship(...)
+    целиком, включая многострочные вызовы, в любом блоке (if/else, try/except/
+    finally). Работает по позициям узлов ast (смещения в байтах UTF-8),
+    остальной текст файла не трогается.
+    """
+    data = source.encode('utf-8')
+    tree = ast.parse(data)
+
+    line_starts = [0]
+    for line in data.splitlines(keepends=True):
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(lineno, col):
+        return line_starts[lineno - 1] + col
+
+    def skip_blanks(pos, limit, step):
+        """Пропуск пробелов от pos до limit вперёд (step=1) или назад (step=-1)."""
+        while pos != limit and data[pos if step > 0 else pos - 1] in b" \t":
+            pos += step
+        return pos
+
+    def remove_statement(stmt, keep_pass, prev_removed):
+        """Правка, удаляющая оператор; keep_pass — на его месте нужен pass (блок опустел)."""
+        line_start = line_starts[stmt.lineno - 1]
+        line_end = line_starts[min(stmt.end_lineno, len(line_starts) - 1)]
+        start = offset(stmt.lineno, stmt.col_offset)
+        end = offset(stmt.end_lineno, stmt.end_col_offset)
+        rest = data[end:line_end].strip()
+        if rest.startswith(b";"):
+            rest = rest[1:].strip()
+        if not data[line_start:start].strip() and (not rest or rest.startswith(b"#")):
+            # оператор занимает свои строки целиком
+            return line_start, line_end, data[line_start:start] + b"pass\n" if keep_pass else b""
+
+        # на строке есть другие операторы: удаляется только этот вместе с ';'
+        replacement = b"pass" if keep_pass else b""
+        after = skip_blanks(end, line_end, 1)
+        if data[after:after + 1] == b";":
+            return start, skip_blanks(after + 1, line_end, 1), replacement
+        before = skip_blanks(start, line_start, -1)
+        if not prev_removed and data[before - 1:before] == b";":
+            return before - 1, end, replacement
+        return start, end, replacement
+
+    edits = []  # (start, end, replacement)
+
+    for node in ast.walk(tree):
+        for stmts in _statement_lists(node):
+            removed = [
+                i for i, stmt in enumerate(stmts)
+                if isinstance(stmt, (ast.Assign, ast.AnnAssign)) and _is_db_call(stmt.value, 'relationship')
+            ]
+            for i in removed:
+                keep_pass = len(removed) == len(stmts) and i == removed[0]
+                edits.append(remove_statement(stmts[i], keep_pass, i - 1 in removed))
+
+        if isinstance(node, ast.Call):
+            for i, arg in enumerate(node.args):
+                if not _is_db_call(arg, 'ForeignKey'):
+                    continue
+                arg_end = offset(arg.end_lineno, arg.end_col_offset)
+                if i > 0:
+                    prev = node.args[i - 1]
+                    edits.append((offset(prev.end_lineno, prev.end_col_offset), arg_end, b""))
+                else:
+                    # db.Column(db.ForeignKey(...)) — тип выводился из внешнего
+                    # ключа, без него колонка не создастся
+                    edits.append((offset(arg.lineno, arg.col_offset), arg_end, b"db.Integer"))
+
+    if not edits:
+        return source
+
+    # Правки внутри уже удаляемых участков не нужны
+    edits.sort(key=lambda e: (e[0], -e[1]))
+    merged = []
+    for edit in edits:
+        if merged and edit[0] < merged[-1][1]:
+            continue
+        merged.append(edit)
+
+    for start, end, replacement in reversed(merged):
+        data = data[:start] + replacement + data[end:]
+    return data.decode('utf-8')
+
+
+def sanitize_source(source):
+    """Очищенный текст модуля (ast, а для непарсящихся файлов — регулярки)."""
+    try:
+        return _sanitize_ast(source)
+    except (SyntaxError, ValueError):
+        new_source = FK_RE.sub("", source)
+        return RELATIONSHIP_RE.sub("", new_source)
+
+
+def sanitize_bytes(data, cache=None):
+    """Возвращает очищенный текст или None, если файл менять не нужно."""
+    if not any(marker in data for marker in MARKERS):
+        return None
+
+    digest = hashlib.sha256(SANITIZER_VERSION + b"\0" + data).hexdigest()
+    if cache is not None:
+        found, value = cache.get(digest)
+        if found:
+            return value
+
+    try:
+        source = data.decode('utf-8')
+        new_source = sanitize_source(source)
+        value = new_source if new_source != source else None
+    except UnicodeDecodeError:
+        value = None
+
+    if cache is not None:
+        cache.put(digest, value)
+    return value
+
+
+def sanitized_file_bytes(src, cache=None, stats=None, timings=None):
+    """
+    Содержимое .py-файла в байтах — очищенное или исходное, если очищать
+    нечего (файл уже прочитан, повторно читать его не нужно); None — не .py,
+    файл берётся как есть. stats — список, куда добавляются изменённые
+    файлы; timings — dict, в timings['sanitize'] накапливается время очистки.
+    """
+    if not src.endswith('.py'):
+        return None
+
+    with open(src, 'rb') as f:
+        data = f.read()
+    started = time.perf_counter()
+    new_source = sanitize_bytes(data, cache)
+    if timings is not None:
+        timings['sanitize'] = timings.get('sanitize', 0.0) + time.perf_counter() - started
+    if new_source is None:
+        return data
+    if stats is not None:
+        stats.append(src)
+    return new_source.encode('utf-8')
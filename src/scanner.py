@@ -1,11 +1,54 @@
 import os
+import re
+import sys
+import fnmatch
+
+DEFAULT_IGNORES = ['.*', '__pycache__', 'venv', 'env', 'node_modules', 'instance']
+IGNORE_FILES = ['.gitignore', '.dockerignore']
+SERVICE_MARKERS = {"routes.py", "views.py"}
+REQUIREMENT_NAME_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+# Импорты, имя которых не совпадает с именем дистрибутива на PyPI
+IMPORT_DISTRIBUTIONS = {
+    "attr": ["attrs"],
+    "bs4": ["beautifulsoup4"],
+    "cv2": ["opencv-python", "opencv-python-headless", "opencv-contrib-python"],
+    "Crypto": ["pycryptodome", "pycrypto"],
+    "dateutil": ["python-dateutil"],
+    "docx": ["python-docx"],
+    "dotenv": ["python-dotenv"],
+    "fitz": ["pymupdf"],
+    "jose": ["python-jose"],
+    "jwt": ["pyjwt"],
+    "kafka": ["kafka-python"],
+    "magic": ["python-magic"],
+    "multipart": ["python-multipart"],
+    "MySQLdb": ["mysqlclient"],
+    "OpenSSL": ["pyopenssl"],
+    "PIL": ["pillow"],
+    "pkg_resources": ["setuptools"],
+    "psycopg2": ["psycopg2-binary", "psycopg2"],
+    "rest_framework": ["djangorestframework"],
+    "serial": ["pyserial"],
+    "sklearn": ["scikit-learn"],
+    "slugify": ["python-slugify"],
+    "socketio": ["python-socketio"],
+    "telegram": ["python-telegram-bot"],
+    "yaml": ["pyyaml"],
+    "zmq": ["pyzmq"],
+}
+# Нужны во время работы, хотя в коде не импортируются (драйверы БД, серверы)
+RUNTIME_DISTRIBUTIONS = {
+    "psycopg2", "psycopg2-binary", "psycopg", "psycopg-binary", "pg8000", "pymysql", "mysqlclient",
+    "gunicorn", "gevent", "eventlet", "uwsgi", "waitress",
+}
 
 def parse_requirements(file_path):
     """Читает файл requirements.txt и возвращает список библиотек."""
     dependencies = []
     if not os.path.exists(file_path):
         return []
-        
+
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
@@ -18,47 +61,172 @@ def parse_requirements(file_path):
         print(f"Ошибка чтения {file_path}: {e}")
         return []
 
-def scan_project_structure(root_path):
+def requirement_name(requirement):
     """
-    Рекурсивно обходит папки и строит ИНТЕЛЛЕКТУАЛЬНУЮ карту проекта.
-    Определяет тип модуля: "service" (для Docker) или "shared" (общий код).
+    Нормализованное имя дистрибутива из строки requirements.txt
+    ('Flask-SQLAlchemy==3.1.1' -> 'flask-sqlalchemy'). Для опций pip
+    (-r, -e, --index-url) и ссылок возвращает None.
     """
-    project_map = {
-        "root": root_path,
-        "modules": [],       
-        "dependencies": {},  
-        "files": []          
-    }
+    if requirement.startswith('-') or re.match(r"^[\w+.-]+://", requirement):
+        return None
+    match = REQUIREMENT_NAME_RE.match(requirement)
+    if not match:
+        return None
+    return re.sub(r"[-_.]+", "-", match.group(1)).lower()
 
-    print(f"🔍 [SCANNER] Начинаю глубокий анализ монолита: {root_path}")
+def import_distributions(import_name):
+    """Возможные имена дистрибутивов (нормализованные) для импорта верхнего уровня."""
+    names = {re.sub(r"[-_.]+", "-", import_name).lower()}
+    names.update(IMPORT_DISTRIBUTIONS.get(import_name, []))
+    return names
+
+def prune_requirements(requirements, imports):
+    """
+    Делит зависимости на нужные по списку импортов и лишние.
+    Остаются: импортируемые пакеты, драйверы/серверы из RUNTIME_DISTRIBUTIONS
+    и строки, которые не являются требованиями (опции pip, ссылки).
+    Возвращает (kept, dropped).
+    """
+    wanted = set()
+    for name in imports:
+        if name not in sys.stdlib_module_names:
+            wanted.update(import_distributions(name))
+
+    kept, dropped = [], []
+    for requirement in requirements:
+        name = requirement_name(requirement)
+        if name is None or name in wanted or name in RUNTIME_DISTRIBUTIONS:
+            kept.append(requirement)
+        else:
+            dropped.append(requirement)
+    return kept, dropped
+
+def parse_ignore_file(file_path):
+    """
+    Упрощённый разбор .gitignore/.dockerignore.
+    Возвращает список правил (pattern, negate, dir_only, anchored).
+    """
+    rules = []
+    for line in parse_requirements(file_path):
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        anchored = line.startswith('/') or '/' in line
+        line = line.lstrip('/')
+        if line.startswith('**/'):
+            line, anchored = line[3:], False
+        if line:
+            rules.append((line, negate, dir_only, anchored))
+    return rules
+
+def load_ignore_rules(root_path):
+    rules = [(pattern, False, False, False) for pattern in DEFAULT_IGNORES]
+    for name in IGNORE_FILES:
+        rules.extend(parse_ignore_file(os.path.join(root_path, name)))
+    return rules
+
+def is_ignored(rel_path, is_dir, rules):
+    """Последнее совпавшее правило побеждает (как в git)."""
+    name = rel_path.rsplit('/', 1)[-1]
+    ignored = False
+    for pattern, negate, dir_only, anchored in rules:
+        if dir_only and not is_dir:
+            continue
+        if fnmatch.fnmatch(rel_path if anchored else name, pattern):
+            ignored = not negate
+    return ignored
+
+def iter_project_structure(root_path, max_depth=1, exclude=None, follow_symlinks=True):
+    """
+    Потоковый обход монолита на os.scandir.
+    Генерирует события по мере обнаружения:
+        ("dependencies", rel_path, [зависимости])
+        ("module", {"name", "path", "type", "files_count"})
+    max_depth — сколько уровней каталогов под корнем просматривать
+    (1 — только модули верхнего уровня, этого достаточно генератору).
+    exclude — абсолютные пути, которые нужно пропустить (например, docker_out).
+    Учитываются .gitignore/.dockerignore в корне; циклы симлинков отсекаются.
+    Генератор события не потребляет: граф импортов, заглушки и зависимости
+    сервиса зависят от списка всех модулей, а сам обход занимает малую долю
+    генерации, поэтому он берёт готовую карту из scan_project_structure.
+    """
+    rules = load_ignore_rules(root_path)
+    excluded = {os.path.realpath(p) for p in (exclude or [])}
+    visited = set()
+    stack = [(root_path, ".", 0)]
+
+    while stack:
+        dir_path, rel_path, depth = stack.pop()
+        try:
+            st = os.stat(dir_path)
+        except OSError:
+            continue
+        if (st.st_dev, st.st_ino) in visited:
+            continue
+        visited.add((st.st_dev, st.st_ino))
+
+        filenames, subdirs = [], []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    child_rel = entry.name if rel_path == "." else f"{rel_path}/{entry.name}"
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                    except OSError:
+                        continue
+                    if is_ignored(child_rel, is_dir, rules):
+                        continue
+                    if is_dir:
+                        if depth < max_depth and os.path.realpath(entry.path) not in excluded:
+                            subdirs.append((entry.path, child_rel))
+                    elif entry.is_file():
+                        filenames.append(entry.name)
+        except OSError as e:
+            print(f"Ошибка чтения {dir_path}: {e}")
+            continue
 
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d not in ['__pycache__', 'venv', 'env', 'node_modules', 'instance']]
-        
-        rel_path = os.path.relpath(dirpath, root_path)
-        depth = rel_path.count(os.sep)
-        
         if "requirements.txt" in filenames:
-            full_req_path = os.path.join(dirpath, "requirements.txt")
-            deps = parse_requirements(full_req_path)
-            project_map["dependencies"][rel_path] = deps
+            yield ("dependencies", rel_path, parse_requirements(os.path.join(dir_path, "requirements.txt")))
 
-        if depth == 0 and rel_path != ".":
+        if depth == 1:
             py_files = [f for f in filenames if f.endswith(".py")]
-            
             if py_files:
-                is_service = any(f in ["routes.py", "views.py"] for f in filenames)
-                module_type = "service" if is_service else "shared"
-                
-                project_map["modules"].append({
+                is_service = any(f in SERVICE_MARKERS for f in filenames)
+                yield ("module", {
                     "name": rel_path,
                     "path": rel_path,
-                    "type": module_type,
+                    "type": "service" if is_service else "shared",
                     "files_count": len(py_files)
                 })
-                
-                icon = "🚀" if is_service else "📚"
-                print(f"   {icon} [MODULE] Найден {module_type}: {rel_path} (файлов: {len(py_files)})")
+
+        # в обратном порядке, чтобы модули выходили по алфавиту
+        for sub_path, sub_rel in sorted(subdirs, key=lambda d: d[1], reverse=True):
+            stack.append((sub_path, sub_rel, depth + 1))
+
+def scan_project_structure(root_path, max_depth=1, exclude=None):
+    """
+    Строит ИНТЕЛЛЕКТУАЛЬНУЮ карту проекта.
+    Определяет тип модуля: "service" (для Docker) или "shared" (общий код).
+    """
+    project_map = {
+        "root": root_path,
+        "modules": [],
+        "dependencies": {},
+        "files": []
+    }
+
+    print(f"🔍 [SCANNER] Начинаю глубокий анализ монолита: {root_path}")
+
+    for event in iter_project_structure(root_path, max_depth=max_depth, exclude=exclude):
+        if event[0] == "dependencies":
+            project_map["dependencies"][event[1]] = event[2]
+        elif event[0] == "module":
+            module = event[1]
+            project_map["modules"].append(module)
+            icon = "🚀" if module["type"] == "service" else "📚"
+            print(f"   {icon} [MODULE] Найден {module['type']}: {module['path']} (файлов: {module['files_count']})")
 
     return project_map
 
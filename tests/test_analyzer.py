@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import analyzer
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_db_imports_are_roots_for_every_service(tmp_path):
+    # db.py копируется в каждый сервис — его импорты нужны всем
+    write(str(tmp_path / "db.py"), "import yaml\nfrom common.cfg import URL\n")
+    write(str(tmp_path / "common" / "cfg.py"), "URL = 'sqlite://'\n")
+    write(str(tmp_path / "users" / "routes.py"), "from db import db\n")
+    modules = [
+        {"name": "users", "path": "users", "type": "service"},
+        {"name": "common", "path": "common", "type": "shared"},
+    ]
+
+    graph = analyzer.analyze_project(str(tmp_path), modules)
+    deps = analyzer.resolve_service_dependencies(graph, "users", modules)
+
+    assert deps["shared"] == ["common"]
+    assert deps["stubs"] == []
+    assert deps["external"] == ["yaml"]
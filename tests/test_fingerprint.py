@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import fingerprint
+
+
+def test_stat_cache_drops_files_not_hashed_in_this_run(tmp_path):
+    cache_path = str(tmp_path / "file_hashes.json")
+    kept, removed = str(tmp_path / "kept.py"), str(tmp_path / "removed.py")
+    for path in (kept, removed):
+        with open(path, "w") as f:
+            f.write(path)
+
+    cache = fingerprint.StatCache(cache_path)
+    fingerprint.file_hash(kept, cache)
+    fingerprint.file_hash(removed, cache)
+    cache.save()
+    os.remove(removed)
+
+    cache = fingerprint.StatCache(cache_path)
+    digest = fingerprint.file_hash(kept, cache)
+    cache.save()
+
+    assert fingerprint.load_json(cache_path) == {kept: [os.stat(kept).st_size, os.stat(kept).st_mtime_ns, digest]}
@@ -0,0 +1,50 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src'))
+sys.path.append(ROOT)
+
+import analyzer
+import generator
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_prune_keeps_requirements_imported_by_db(tmp_path):
+    write(str(tmp_path / "db.py"), "import yaml\n")
+    write(str(tmp_path / "users" / "routes.py"), "from db import db\n")
+    modules = [{"name": "users", "path": "users", "type": "service"}]
+    module = dict(modules[0])
+    module.update(analyzer.resolve_service_dependencies(
+        analyzer.analyze_project(str(tmp_path), modules), "users", modules))
+
+    deps = {".": ["pyyaml==6.0.1", "redis==5.0.0"]}
+    requirements = generator.collect_requirements(module, deps, prune=True)
+
+    assert "pyyaml==6.0.1" in requirements
+    assert "redis==5.0.0" not in requirements
+
+
+def test_postgres_limit_covers_service_budgets(tmp_path):
+    from create_test_monolith import create_synthetic_project
+
+    source = str(tmp_path / "monolith")
+    output = str(tmp_path / "docker_out")
+    create_synthetic_project(source, modules=60, files_per_module=1, models_per_module=1)
+    result = generator.run_generation(source, output, db_max_connections=100)
+
+    assert not result["failed"]
+    services = result["built"]
+    assert len(services) == 60
+    with open(os.path.join(output, "docker-compose.yaml"), encoding="utf-8") as f:
+        compose = f.read()
+    # 60 сервисов по 2 соединения + резерв не помещаются в 100
+    expected = len(services) * generator.DB_MIN_SERVICE_CONNECTIONS + generator.DB_RESERVED_CONNECTIONS
+    assert f"max_connections={expected}" in compose
+    with open(os.path.join(output, services[0], "run.py"), encoding="utf-8") as f:
+        assert f"'DB_MAX_CONNECTIONS', {generator.DB_MIN_SERVICE_CONNECTIONS})" in f.read()
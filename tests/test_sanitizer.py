@@ -0,0 +1,87 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import sanitizer
+
+
+def sanitize(source):
+    result = sanitizer.sanitize_source(source)
+    compile(result, "models.py", "exec")
+    return result
+
+
+def test_multiline_relationship_is_removed():
+    source = (
+        "class Order(db.Model):\n"
+        "    id = db.Column(db.Integer, primary_key=True)\n"
+        "    user = db.relationship(\n"
+        "        'User',\n"
+        "        backref='orders',\n"
+        "    )\n"
+        "    total = db.Column(db.Integer)\n"
+    )
+    assert sanitize(source) == (
+        "class Order(db.Model):\n"
+        "    id = db.Column(db.Integer, primary_key=True)\n"
+        "    total = db.Column(db.Integer)\n"
+    )
+
+
+def test_foreign_key_arguments():
+    source = (
+        "class Order(db.Model):\n"
+        "    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)\n"
+        "    product_id = db.Column(db.ForeignKey('product.id'))\n"
+    )
+    assert sanitize(source) == (
+        "class Order(db.Model):\n"
+        "    user_id = db.Column(db.Integer, nullable=False)\n"
+        "    product_id = db.Column(db.Integer)\n"
+    )
+
+
+def test_empty_class_body_becomes_pass():
+    source = (
+        "class Link(db.Model):\n"
+        "    user = db.relationship('User')\n"
+        "    product = db.relationship('Product')\n"
+    )
+    assert sanitize(source) == "class Link(db.Model):\n    pass\n"
+
+
+def test_statement_sharing_a_line_is_kept():
+    assert sanitize("a = 1; r = db.relationship('X')\n") == "a = 1\n"
+    assert sanitize("r = db.relationship('X'); a = 1\n") == "a = 1\n"
+    assert sanitize("class A(db.Model): r = db.relationship('X'); s = db.relationship('Y')\n") == "class A(db.Model): pass\n"
+
+
+def test_relationship_in_else_except_finally():
+    source = (
+        "class A(db.Model):\n"
+        "    if FLAG:\n"
+        "        a = 1\n"
+        "    else:\n"
+        "        r = db.relationship('X')\n"
+        "    try:\n"
+        "        b = 2\n"
+        "    except ImportError:\n"
+        "        r = db.relationship('X')\n"
+        "    finally:\n"
+        "        c = 3\n"
+        "        r = db.relationship('X')\n"
+    )
+    assert sanitize(source) == (
+        "class A(db.Model):\n"
+        "    if FLAG:\n"
+        "        a = 1\n"
+        "    else:\n"
+        "        pass\n"
+        "    try:\n"
+        "        b = 2\n"
+        "    except ImportError:\n"
+        "        pass\n"
+        "    finally:\n"
+        "        c = 3\n"
+    )